@@ -1,25 +1,39 @@
 import argparse
 import asyncio
 from asyncio import AbstractEventLoop
+from collections import Counter, OrderedDict
 import csv
-from datetime import datetime
+import hashlib
 import html
+from itertools import islice
 import logging
 import os
+import pickle
 import re
-from typing import List
+import time
+from typing import AsyncIterator, Awaitable, Dict, Iterable, List, Optional, Tuple
+from urllib.parse import urlparse
 
+import aiofiles
 import aiohttp
-from aiohttp import ClientSession
-import async_timeout
+from aiohttp import ClientResponse, ClientSession, InvalidURL
+import orjson
 
 URL_TEMPLATE = "https://hacker-news.firebaseio.com/v0/item/{}.json"
 STORY_URL_TEMPLATE = "https://news.ycombinator.com/item?id={}"
 TOP_STORIES_URL = "https://hacker-news.firebaseio.com/v0/topstories.json"
 FETCH_TIMEOUT = 10
-REFERENCES_REGEXP = r'<a[^>]* href="([^"]*)"'
-COLLECTED_STORIES = []
+CHUNK_SIZE = 64 * 1024
+DONE_URLS_CACHE_SIZE = 10000
+EMPTY_CONTENT = ""
+DEFAULT_WORKERS_COUNT = 10
+STORIES_CONCURRENCY_LIMIT = 10
+REFERENCES_REGEXP = re.compile(r'<a[^>]* href="([^"]*)"')
+FILENAME_REGEXP = re.compile(r"[?:*<>,; /\\]")
+COLLECTED_STORIES: Dict[int, int] = {}
 REPORT_FILE = r"report.csv"
+STATE_FILE = r"collected_stories.pickle"
+PENDING_REPORT_ROWS: List[Tuple[int, str]] = []
 
 logging.basicConfig(format="[%(asctime)s] %(levelname).1s %(message)s", datefmt="%Y.%m.%d %H:%M:%S")
 logger = logging.getLogger()
@@ -27,188 +41,501 @@ logger = logging.getLogger()
 
 class URLFetcher:
     """
-    Provides counting of URL fetches for a particular task.
+    Provides counting of URL fetches, it is shared between polling iterations.
+    Duplicated downloads of the same url are performed only once,
+    content for other directories is hardlinked from the downloaded file.
     """
 
     def __init__(self):
         self.fetch_counter = 0
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._done: "OrderedDict[str, Optional[str]]" = OrderedDict()
 
     async def fetch(self, session, url, dest_dir=None, get_response=True, ):
         """
         Fetch a URL using aiohttp returning parsed JSON response or saving to file.
         As suggested by the aiohttp docs we reuse the session.
+        Timeouts are configured on the session, timed out fetches are counted too.
+        Saving to file returns path of saved file, EMPTY_CONTENT for empty content or None on failure.
         """
-        async with async_timeout.timeout(FETCH_TIMEOUT):
-            self.fetch_counter += 1
-            try:
-                async with session.get(url) as response:
-                    if dest_dir:
-                        save_content_to_disk(await response.read(), url, dest_dir)
-                    elif get_response:
-                        return await response.json()
+        if not dest_dir:
+            return await self._fetch(session, url, dest_dir, get_response)
+
+        loop_ = asyncio.get_running_loop()
+        while True:
+            if url in self._inflight:
+                # shield shared future, so cancellation of this waiter does not affect the others,
+                # result of failed download is shared too, later references retry it
+                full_filename = await asyncio.shield(self._inflight[url])
+                if full_filename is None:
+                    return None
+            elif url in self._done:
+                self._done.move_to_end(url)
+                full_filename = self._done[url]
+            else:
+                break
+            # content is empty or linked successfully
+            if not full_filename or await loop_.run_in_executor(None, link_content_to_dir, full_filename, dest_dir):
+                return full_filename
+            # another waiter may have started downloading while linking was running
+            if url not in self._inflight:
+                break
+
+        future = loop_.create_future()
+        self._inflight[url] = future
+        full_filename = None
+        try:
+            full_filename = await self._fetch(session, url, dest_dir, get_response)
+        finally:
+            if not future.done():
+                future.set_result(full_filename)
+            self._inflight.pop(url, None)
+            # only successful downloads are remembered, failed ones are retried on the next reference
+            if full_filename is None:
+                self._done.pop(url, None)
+            else:
+                self._done[url] = full_filename
+                if len(self._done) > DONE_URLS_CACHE_SIZE:
+                    self._done.popitem(last=False)
+
+        return full_filename
+
+    async def _fetch(self, session, url, dest_dir, get_response):
+        """
+        Perform fetch of a URL without deduplication.
+        """
+        self.fetch_counter += 1
+        try:
+            async with session.get(url) as response:
+                if dest_dir:
+                    return await save_content_to_disk(response, url, dest_dir)
+                elif get_response:
+                    return orjson.loads(await response.read())
 
-            except asyncio.TimeoutError:
-                logger.error(f"Timeout error on url: {url}")
+        except asyncio.TimeoutError:
+            logger.error(f"Timeout error on url: {url}")
 
 
-def save_content_to_disk(resp_bytes, url, dest_dir):
+async def save_content_to_disk(response: ClientResponse, url, dest_dir):
     """
-    Save collected from url content to disk
+    Save collected from url content to disk chunk by chunk without buffering of the whole body
 
-    :param resp_bytes: bytes of content
+    :param response: response with content
     :param url: url
     :param dest_dir: destination directory
-    :return:
+    :return: path of saved file, EMPTY_CONTENT if there is nothing to save
     """
-    if resp_bytes is None:
+    if response.content_length == 0:
         logger.debug(f"Empty content on {url}")
-        return
+        return EMPTY_CONTENT
+
+    full_filename = os.path.join(dest_dir, get_content_filename(url))
+    # content is visible under the final name only when it is completely downloaded
+    part_filename = full_filename + ".part"
+    loop_ = asyncio.get_running_loop()
+    try:
+        async with aiofiles.open(part_filename, "wb") as f:
+            async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+                await f.write(chunk)
+        await loop_.run_in_executor(None, os.replace, part_filename, full_filename)
+    except BaseException:
+        await loop_.run_in_executor(None, remove_file, part_filename)
+        raise
+
+    return full_filename
+
+
+def remove_file(filename):
+    """
+    Remove file if it exists
+
+    :param filename: path of file
+    :return:
+    """
+    try:
+        os.remove(filename)
+    except FileNotFoundError:
+        pass
+
+
+def get_content_filename(url) -> str:
+    """
+    Get collision free filename for content of url
+
+    :param url: url
+    :return: hash of url with extension of requested file
+    """
+    extension = FILENAME_REGEXP.sub('', os.path.splitext(urlparse(url).path)[1])
+    return hashlib.blake2b(url.encode(), digest_size=8).hexdigest() + extension[:8]
+
+
+def link_content_to_dir(full_filename, dest_dir) -> bool:
+    """
+    Hardlink already downloaded content to another directory
+
+    :param full_filename: path of downloaded file
+    :param dest_dir: destination directory
+    :return: True if content is available in destination directory
+    """
+    link_filename = os.path.join(dest_dir, os.path.basename(full_filename))
+    try:
+        os.link(full_filename, link_filename)
+    except FileExistsError:
+        pass
+    except OSError as ex:
+        logger.debug(f"Unable to link {full_filename} to {dest_dir}: {ex}")
+        return False
 
-    filename = re.sub(r"[?:*<>,; /\\]", r'', url)
-    full_filename = os.path.join(dest_dir, filename[:20])
-    with open(full_filename, "wb+") as f:
-        f.write(resp_bytes)
+    return True
 
 
-def get_path_of_story(dest_dir, story_title, story_id) -> str:
+def get_path_of_story(dest_dir, story_id) -> str:
     """
     Get path to story directory or create if does not exist
 
     :param dest_dir: destination dir of all stories
-    :param story_title: story title
     :param story_id: story id
     :return: path of story directory
     """
     dir_name = str(story_id)
     path = os.path.join(dest_dir, dir_name)
-    if not os.path.exists(path):
-        # create dir if does nor exist
+    try:
         os.makedirs(path)
-        COLLECTED_STORIES.append(story_id)
+    except FileExistsError:
+        pass
+
+    return path
+
+
+def add_story_to_report(story_id, story_title):
+    """
+    Schedule new story for report
+
+    :param story_id: story id
+    :param story_title: story title
+    :return:
+    """
+    # report rows are written once per polling iteration, see flush_report
+    PENDING_REPORT_ROWS.append((story_id, story_title))
+
+
+def mark_story_as_processed(story_id, max_kid_id):
+    """
+    Remember the latest seen comment of story, it is persisted in state file only
+
+    :param story_id: story id
+    :param max_kid_id: max id of processed story comments
+    :return:
+    """
+    COLLECTED_STORIES[story_id] = max_kid_id
+
+
+def flush_report(dest_dir):
+    """
+    Append pending rows to report file and save processed stories
+
+    :param dest_dir: destination dir of all stories
+    :return:
+    """
+    if PENDING_REPORT_ROWS:
         with open(os.path.join(dest_dir, REPORT_FILE), 'a+', encoding='UTF8', newline='') as f:
             writer = csv.writer(f)
-            writer.writerow([story_id, story_title])
+            writer.writerows(PENDING_REPORT_ROWS)
+        PENDING_REPORT_ROWS.clear()
 
-    return path
+    if COLLECTED_STORIES:
+        save_processed_stories(dest_dir)
 
 
-def load_processed_stories_list(story_dir: str) -> List[int]:
+def save_processed_stories(dest_dir):
     """
-    Load processed stories ids from report file
+    Save processed stories to state file for fast loading on start
+
+    :param dest_dir: destination dir of all stories
+    :return:
+    """
+    path_to_file = os.path.join(dest_dir, STATE_FILE)
+    tmp_path = path_to_file + ".tmp"
+    with open(tmp_path, 'wb') as f:
+        pickle.dump(COLLECTED_STORIES, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, path_to_file)
+
+
+def load_processed_stories_list(story_dir: str) -> Dict[int, int]:
+    """
+    Load processed stories ids from state file or from report file if state is outdated
 
     :param story_dir: path to directory with all stories
-    :return: total list of all processed stories ids
+    :return: max seen comment id by id of all processed stories
     """
     path_to_file = os.path.join(story_dir, REPORT_FILE)
-    total_ids = []
+    path_to_state = os.path.join(story_dir, STATE_FILE)
+    try:
+        if not os.path.exists(path_to_file) or os.path.getmtime(path_to_state) >= os.path.getmtime(path_to_file):
+            with open(path_to_state, 'rb') as f:
+                return pickle.load(f)
+    except (OSError, pickle.UnpicklingError, EOFError) as ex:
+        logger.debug(f"Unable to load state file {path_to_state}: {ex}")
+
+    total_ids = {}
     if os.path.exists(path_to_file):
         with open(path_to_file, 'r', encoding='UTF8') as f:
             reader = csv.reader(f)
             for row in reader:
-                total_ids.append(int(row[0]))
+                # report has no max seen comment id, except of rows written by previous versions
+                total_ids[int(row[0])] = int(row[2]) if len(row) > 2 else 0
 
     return total_ids
 
 
 async def get_page_with_references(loop_: AbstractEventLoop,
+                                   api_session: ClientSession,
                                    session: ClientSession,
                                    fetcher: URLFetcher,
+                                   queue: asyncio.Queue,
+                                   counter: Counter,
                                    post_id,
-                                   story_dir):
+                                   story_dir,
+                                   min_kid_id=0):
     """
-    Retrieve data for current post and recursively for all comments.
+    Retrieve data for current post and enqueue all its comments.
 
     :param loop_: event loop for running
-    :param session: tcp client session
+    :param api_session: tcp client session for HN API requests
+    :param session: tcp client session for downloading of stories and references
     :param fetcher: url fetcher
+    :param queue: queue of (post_id, story_dir) waiting for processing
+    :param counter: counter of collected comments, references and errors
     :param post_id: id if post
     :param story_dir: directory of collected stories
-    :return: number_of_comments, number_of_refs
+    :param min_kid_id: comments of story with id less or equal to this one are already processed
+    :return: ids of enqueued comments
     """
     url = URL_TEMPLATE.format(post_id)
-    number_of_refs = 0
-    response = await fetcher.fetch(session, url)
+    response = await fetcher.fetch(api_session, url)
+
+    if response is None:
+        # post is not retrieved, so the new max seen comment id of story must not be saved
+        counter["errors"] += 1
+        return []
 
     # base case, there are no comments
-    if response is None or "kids" not in response:
-        return 0, number_of_refs
+    if "kids" not in response:
+        return []
+
+    kids = response["kids"]
 
-    elif response.get("type") == "story":
+    if response.get("type") == "story":
         logger.debug("Get story response")
-        story_url = response.get("url", STORY_URL_TEMPLATE.format(post_id))
-        story_dir = get_path_of_story(story_dir, response.get("title", "untitled"), post_id)
-        await fetcher.fetch(session, story_url, dest_dir=story_dir)
+        # directory creation may block on slow file systems, so keep it out of event loop
+        story_dir = await loop_.run_in_executor(None, get_path_of_story, story_dir, post_id)
+        if post_id not in COLLECTED_STORIES:
+            story_url = response.get("url", STORY_URL_TEMPLATE.format(post_id))
+            await fetcher.fetch(session, story_url, dest_dir=story_dir)
+            add_story_to_report(post_id, response.get("title", "untitled"))
+            mark_story_as_processed(post_id, min_kid_id)
+
+        # descend only into comments added since the previous poll
+        kids = [kid_id for kid_id in kids if kid_id > min_kid_id]
 
     elif response.get('type') == "comment":
         logger.debug("Get comment response")
-        refs = set(re.findall(REFERENCES_REGEXP, html.unescape(response.get("text", ""))))
-        number_of_refs = len(refs)
-        tasks = [fetcher.fetch(session, comment_url, dest_dir=story_dir) for comment_url in refs]
-        await asyncio.gather(*tasks)
+        text = response.get("text", "")
+        # skip unescaping of text without any html entities
+        if "&" in text:
+            text = html.unescape(text)
+        refs = set(REFERENCES_REGEXP.findall(text))
+        # most comments have no references, skip gathering of empty task list for them
+        if refs:
+            counter["refs"] += len(refs)
+            tasks = [fetcher.fetch(session, comment_url, dest_dir=story_dir) for comment_url in refs]
+            results = await asyncio.gather(*tasks, return_exceptions=True)
+            # failed reference must not prevent processing of comment replies
+            for comment_url, result in zip(refs, results):
+                if isinstance(result, Exception):
+                    logger.error(f"Error retrieving reference {comment_url}: {result}")
+                # invalid urls will never be downloaded, other failures are retried on the next poll
+                if result is None or isinstance(result, Exception) and not isinstance(result, InvalidURL):
+                    counter["errors"] += 1
 
     # calculate this post's comments as number of comments
-    number_of_comments = len(response["kids"])
+    counter["comments"] += len(kids)
+
+    # enqueue all comments instead of awaiting them recursively
+    for kid_id in kids:
+        queue.put_nowait((kid_id, story_dir))
+
+    return kids
+
+
+async def worker(loop_: AbstractEventLoop,
+                 api_session: ClientSession,
+                 session: ClientSession,
+                 fetcher: URLFetcher,
+                 queue: asyncio.Queue,
+                 counter: Counter):
+    """
+    Process posts from queue until cancellation.
+
+    :param loop_: event loop for running
+    :param api_session: tcp client session for HN API requests
+    :param session: tcp client session for downloading of stories and references
+    :param fetcher: url fetcher
+    :param queue: queue of (post_id, story_dir) waiting for processing
+    :param counter: counter of collected comments, references and errors
+    :return:
+    """
+    while True:
+        post_id, story_dir = await queue.get()
+        try:
+            await get_page_with_references(loop_, api_session, session, fetcher, queue, counter, post_id, story_dir)
+        except Exception as ex:
+            counter["errors"] += 1
+            logger.error(f"Error retrieving post {post_id}: {ex}")
+        finally:
+            queue.task_done()
 
-    # create recursive tasks for all comments
-    tasks = [get_page_with_references(
-        loop_, session, fetcher, kid_id, story_dir) for kid_id in response["kids"]]
 
-    # schedule the tasks and retrieve results
-    results = await asyncio.gather(*tasks)
+async def run_bounded(coros: Iterable[Awaitable], limit: int) -> AsyncIterator:
+    """
+    Run coroutines with at most limit of them simultaneously, coroutines are taken
+    from iterable lazily only when one of the running is completed.
 
-    # reduce the descendents comments and add it to this post's
-    number_of_comments += sum([res[0] for res in results])
-    number_of_refs += sum([res[1] for res in results])
+    :param coros: iterable of coroutines
+    :param limit: max count of simultaneously running coroutines
+    :return: async iterator of results in order of completion, the first exception is raised
+             after results of all simultaneously completed coroutines
+    """
+    coros = iter(coros)
+    pending = {asyncio.ensure_future(coro) for coro in islice(coros, limit)}
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            pending.update(asyncio.ensure_future(coro) for coro in islice(coros, len(done)))
+            # retrieve results of all completed tasks before raising the first exception
+            errors = [task.exception() for task in done if task.exception() is not None]
+            for task in done:
+                if task.exception() is None:
+                    yield task.result()
+            if errors:
+                raise errors[0]
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+async def get_story_with_references(loop_: AbstractEventLoop,
+                                    api_session: ClientSession,
+                                    session: ClientSession,
+                                    fetcher: URLFetcher,
+                                    post_id,
+                                    path: str,
+                                    workers_count: int,
+                                    min_kid_id: int):
+    """
+    Retrieve story and all its comments using pool of workers.
 
-    return number_of_comments, number_of_refs
+    :param loop_: event loop for running
+    :param api_session: tcp client session for HN API requests
+    :param session: tcp client session for downloading of stories and references
+    :param fetcher: url fetcher
+    :param post_id: id of story
+    :param path: destination dir for collecting stories
+    :param workers_count: number of workers
+    :param min_kid_id: comments of story with id less or equal to this one are already processed
+    :return: post_id, counter of collected comments and references
+    """
+    queue = asyncio.Queue()
+    counter = Counter()
+    # story itself is processed before workers start, so its new comments are known
+    try:
+        kids = await get_page_with_references(loop_, api_session, session, fetcher, queue, counter, post_id, path,
+                                              min_kid_id)
+    except Exception as ex:
+        logger.error(f"Error retrieving story {post_id}: {ex}")
+        return post_id, counter
+
+    workers = [asyncio.ensure_future(worker(loop_, api_session, session, fetcher, queue, counter))
+               for _ in range(workers_count)]
+    try:
+        await queue.join()
+    finally:
+        for task in workers:
+            task.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+
+    # comments of failed subtrees and references are processed again on the next poll
+    if kids and not counter["errors"]:
+        mark_story_as_processed(post_id, max(kids))
+
+    return post_id, counter
 
 
 async def get_top_stories_with_references(loop_: AbstractEventLoop,
+                                          fetcher: URLFetcher,
                                           limit: int,
                                           path: str,
-                                          connections_limit) -> int:
+                                          limit_total: int,
+                                          limit_per_host: int) -> int:
     """
     Retrieve top stories in HN
 
     :param loop_: event loop for running
+    :param fetcher: url fetcher
     :param limit: max count of stories
     :param path: destination dir for collecting stories
-    :param connections_limit: connections_limit for TCP client
+    :param limit_total: total connections limit for TCP client (0 - unlimited)
+    :param limit_per_host: per host connections limit for downloading of stories (0 - unlimited)
     :return: num of fetches
     """
-    connector = aiohttp.TCPConnector(limit_per_host=connections_limit, loop=loop_)
-    async with aiohttp.ClientSession(connector=connector) as session:
-        # create a new fetcher for this task
-        fetcher = URLFetcher()
+    # HN API requests go through a dedicated session without per host limit,
+    # so throttling of story downloads does not starve the comments recursion,
+    # total limit of connections is split between both sessions
+    api_limit = (limit_total + 1) // 2
+    api_connector = aiohttp.TCPConnector(limit=api_limit, limit_per_host=0, ttl_dns_cache=300,
+                                         force_close=False, enable_cleanup_closed=True, loop=loop_)
+    connector = aiohttp.TCPConnector(limit=limit_total - api_limit, limit_per_host=limit_per_host, ttl_dns_cache=300,
+                                     force_close=False, enable_cleanup_closed=True, loop=loop_)
+    timeout = aiohttp.ClientTimeout(total=FETCH_TIMEOUT, connect=3, sock_read=FETCH_TIMEOUT)
+    # total number of workers is shared between simultaneously processed stories
+    workers_count = (limit_per_host or DEFAULT_WORKERS_COUNT) * 4
+    story_workers_count = max(workers_count // max(min(STORIES_CONCURRENCY_LIMIT, limit), 1), 1)
+    async with aiohttp.ClientSession(connector=api_connector, timeout=timeout) as api_session, \
+            aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+        fetches_before = fetcher.fetch_counter
 
         try:
-            response = await fetcher.fetch(session, TOP_STORIES_URL)
+            response = await fetcher.fetch(api_session, TOP_STORIES_URL)
         except Exception as ex:
             logger.error(f"Error retrieving top stories: {ex}")
             raise
 
-        tasks = [get_page_with_references(
-            loop_, session, fetcher, post_id, path) for post_id in response[:limit] if
-            post_id not in COLLECTED_STORIES]
+        # already collected stories are processed incrementally, only with new comments
+        coros = (get_story_with_references(
+            loop_, api_session, session, fetcher, post_id, path, story_workers_count, COLLECTED_STORIES.get(post_id, 0))
+            for post_id in response[:limit])
 
         try:
-            results = await asyncio.gather(*tasks)
+            # log each story as soon as it is completed
+            async for post_id, counter in run_bounded(coros, STORIES_CONCURRENCY_LIMIT):
+                logger.info(f"Post {post_id} has {counter['comments']} comments and {counter['refs']} references")
         except Exception as ex:
             logger.error(f"Error retrieving comments for top stories: {ex}")
             raise
+        finally:
+            flush_report(path)
 
-        for post_id, num_comments in zip(response[:limit], results):
-            logger.info(f"Post {post_id} has {num_comments} comments")
-
-        logger.debug(f"Complete loading top stories with {fetcher.fetch_counter} fetches")
-        return fetcher.fetch_counter
+        fetch_count = fetcher.fetch_counter - fetches_before
+        logger.debug(f"Complete loading top stories with {fetch_count} fetches")
+        return fetch_count
 
 
 async def poll_top_stories(loop_: AbstractEventLoop,
                            period: int,
                            limit: int,
                            path: str,
-                           connections_limit: int):
+                           limit_total: int,
+                           limit_per_host: int):
     """
     Scheduling of get_top_stories_with_references.
 
@@ -216,28 +543,40 @@ async def poll_top_stories(loop_: AbstractEventLoop,
     :param period: Waiting period in seconds
     :param limit: max count of stories
     :param path: destination dir for collecting stories
-    :param connections_limit: connections_limit for TCP client
+    :param limit_total: total connections limit for TCP client (0 - unlimited)
+    :param limit_per_host: per host connections limit for TCP client (0 - unlimited)
     :return:
     """
+    # fetcher remembers successfully downloaded urls, so content referenced again
+    # in the next iterations is linked instead of downloading, failed urls are retried
+    fetcher = URLFetcher()
     iterations = 0
     while True:
         logger.info(f"Downloading content for top {limit} stories (iteration = {iterations})")
         iterations += 1
-        now = datetime.now()
+        start_time = time.perf_counter_ns()
+        # period is counted from the start of iteration, so waiting overlaps with downloading
+        sleeper = asyncio.ensure_future(asyncio.sleep(period))
         try:
             fetch_count = await get_top_stories_with_references(loop_,
+                                                                fetcher,
                                                                 limit,
                                                                 path,
-                                                                connections_limit)
-            total_time = (datetime.now() - now).total_seconds()
+                                                                limit_total,
+                                                                limit_per_host)
+            total_time = (time.perf_counter_ns() - start_time) / 1e9
             logger.info(f"The downloading took {total_time:.3f} seconds and {fetch_count} fetches")
 
         except Exception as ex:
             logger.error(f"Unexpected exception in poll_top_stories: {ex}")
 
         iterations += 1
-        logger.info(f"Waiting ({period} sec.) ... ")
-        await asyncio.sleep(period)
+        remaining_time = max(period - (time.perf_counter_ns() - start_time) / 1e9, 0)
+        logger.info(f"Waiting ({remaining_time:.3f} sec.) ... ")
+        try:
+            await sleeper
+        finally:
+            sleeper.cancel()
 
 
 if __name__ == '__main__':
@@ -251,11 +590,17 @@ if __name__ == '__main__':
                         help="Flag of dry run. If True, use log level - DEBUG")
     parser.add_argument("--path", type=str, default="./data",
                         help="Path to folder, where collected news will stored")
-    parser.add_argument("--connections_limit", type=int, default=3,
-                        help="The limit for connections")
+    parser.add_argument("--limit-total", type=int, default=100,
+                        help="The total limit for simultaneous connections, "
+                             "split between HN API and downloading of stories (0 - unlimited)")
+    parser.add_argument("--limit-per-host", type=int, default=30,
+                        help="The limit for simultaneous connections to the same host (0 - unlimited)")
     parser.add_argument("--log", type=str, default="crawler.log",
                         help="Name of logfile")
     args = parser.parse_args()
+    if args.limit_total == 1:
+        # each of HN API and downloading sessions needs at least one connection
+        parser.error("--limit-total must be 0 or at least 2")
 
     fh = logging.FileHandler(args.log)
     fh.setLevel(logging.INFO if not args.verbose else logging.DEBUG)
@@ -264,9 +609,21 @@ if __name__ == '__main__':
     COLLECTED_STORIES = load_processed_stories_list(args.path)
 
     logger.info(f"Ycrawler started with options: {args.__dict__}")
-    loop = asyncio.get_event_loop()
+    # uvloop is not available on Windows, default event loop is used there
+    try:
+        import uvloop
+        loop = uvloop.new_event_loop()
+    except ImportError:
+        logger.debug("uvloop is not installed, default event loop is used")
+        loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    # complete short-circuited tasks inline without scheduling on event loop (python 3.12+)
+    eager_task_factory = getattr(asyncio, "eager_task_factory", None)
+    if eager_task_factory is not None:
+        loop.set_task_factory(eager_task_factory)
     try:
-        loop.run_until_complete(poll_top_stories(loop, args.period, args.limit, args.path, args.connections_limit))
+        loop.run_until_complete(poll_top_stories(loop, args.period, args.limit, args.path,
+                                                 args.limit_total, args.limit_per_host))
 
     except Exception as ex:
         logger.error(f"Unexpected exception: {ex}", exc_info=True)